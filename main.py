@@ -1,10 +1,24 @@
 import os
+import sys
 import json
+import time
+import asyncio
+import hashlib
+import inspect
+import secrets
+import string
+import threading
+import contextvars
 import httpx
+import uvicorn
+from uvicorn.importer import import_from_string
+from urllib.parse import urlparse
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Set, Tuple, Type, Callable
 from datetime import datetime
 from dotenv import load_dotenv
 from loguru import logger
@@ -17,13 +31,54 @@ FEISHU_WEBHOOK_URL = os.getenv("FEISHU_WEBHOOK_URL", "")
 # 临时开启调试模式
 DEBUG_MODE = os.getenv("DEBUG_MODE", "true").lower() == "true"
 
+# 告警风暴检测: 统计窗口(秒)、窗口内单项目事件数阈值(0 表示不切换摘要模式)、Top-K 数量
+ALERT_STORM_WINDOW_SECONDS = int(os.getenv("ALERT_STORM_WINDOW_SECONDS", "60"))
+ALERT_STORM_THRESHOLD = int(os.getenv("ALERT_STORM_THRESHOLD", "0"))
+ALERT_STORM_TOP_K = int(os.getenv("ALERT_STORM_TOP_K", "10"))
+
+# 飞书卡片请求体大小上限(字节)，超出时按优先级截断或丢弃次要内容；卡片中最多展示的应用堆栈帧数
+FEISHU_CARD_MAX_BYTES = int(os.getenv("FEISHU_CARD_MAX_BYTES", "20000"))
+FEISHU_CARD_MAX_FRAMES = int(os.getenv("FEISHU_CARD_MAX_FRAMES", "5"))
+
+# 关闭服务时等待进行中的请求和飞书发送完成的最长时间(秒)
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "15"))
+
+# Sentry 重试去重: 缓存的投递数量上限和有效期(秒)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+
+# 从 Sentry API 补充缺少堆栈的负载: API 地址和令牌(均配置时启用)、单次补充的最长等待时间(秒)、结果缓存有效期(秒)、获取失败的缓存有效期(秒)和数量上限
+SENTRY_API_URL = os.getenv("SENTRY_API_URL", "").rstrip("/")
+SENTRY_API_TOKEN = os.getenv("SENTRY_API_TOKEN", "")
+SENTRY_ENRICH_TIMEOUT = float(os.getenv("SENTRY_ENRICH_TIMEOUT", "1.0"))
+SENTRY_ENRICH_TTL_SECONDS = float(os.getenv("SENTRY_ENRICH_TTL_SECONDS", "300"))
+SENTRY_ENRICH_FAILURE_TTL_SECONDS = float(os.getenv("SENTRY_ENRICH_FAILURE_TTL_SECONDS", "30"))
+SENTRY_ENRICH_CACHE_SIZE = int(os.getenv("SENTRY_ENRICH_CACHE_SIZE", "1000"))
+
+# 飞书发送并发控制: 全局最大并发、单个 Webhook 地址的最大并发和排队上限
+FEISHU_MAX_CONCURRENCY = int(os.getenv("FEISHU_MAX_CONCURRENCY", "20"))
+FEISHU_DESTINATION_CONCURRENCY = int(os.getenv("FEISHU_DESTINATION_CONCURRENCY", "2"))
+FEISHU_DESTINATION_QUEUE_SIZE = int(os.getenv("FEISHU_DESTINATION_QUEUE_SIZE", "100"))
+
+# 管理接口令牌，未配置时管理接口不可用
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 # 解析项目到飞书Webhook URL的映射配置
-def parse_project_webhook_mapping() -> Dict[Any, str]:
-    """解析项目到飞书Webhook URL的映射配置
+def _as_url_list(value: Any) -> List[str]:
+    """将单个URL或URL列表统一为列表"""
+    if isinstance(value, list):
+        return [str(url).strip() for url in value if url]
+    if isinstance(value, str):
+        return [url.strip() for url in value.split('|') if url.strip()]
+    return []
+
+
+def parse_project_webhook_mapping() -> Dict[Any, List[str]]:
+    """解析项目到飞书Webhook URL的映射配置，每个项目可以配置多个URL
     
     支持格式:
-    1. JSON格式: {"project_id_1": "url1", "project_name": "url2"}
-    2. 简单格式: project_id_1=url1,project_name=url2
+    1. JSON格式: {"project_id_1": "url1", "project_name": ["url2", "url3"]}
+    2. 简单格式: project_id_1=url1,project_name=url2|url3
     """
     mapping_config = os.getenv("PROJECT_FEISHU_WEBHOOK_MAPPING", "{}")
     try:
@@ -35,9 +90,9 @@ def parse_project_webhook_mapping() -> Dict[Any, str]:
             result = {}
             for key, value in raw_mapping.items():
                 if key.isdigit():
-                    result[int(key)] = value
+                    result[int(key)] = _as_url_list(value)
                 else:
-                    result[key] = value
+                    result[key] = _as_url_list(value)
             return result
         else:
             # 简单格式: key1=value1,key2=value2
@@ -50,9 +105,9 @@ def parse_project_webhook_mapping() -> Dict[Any, str]:
                         key = key.strip()
                         value = value.strip()
                         if key.isdigit():
-                            result[int(key)] = value
+                            result[int(key)] = _as_url_list(value)
                         else:
-                            result[key] = value
+                            result[key] = _as_url_list(value)
             return result
     except (json.JSONDecodeError, ValueError) as e:
         logger.warning(f"Failed to parse PROJECT_FEISHU_WEBHOOK_MAPPING: {e}, using empty mapping")
@@ -60,6 +115,56 @@ def parse_project_webhook_mapping() -> Dict[Any, str]:
 
 PROJECT_WEBHOOK_MAPPING = parse_project_webhook_mapping()
 
+
+def _as_key_set(value: Any, lower: bool = False) -> Optional[Set[Any]]:
+    """路由条件统一为集合，未配置时返回 None 表示不限制"""
+    if value is None:
+        return None
+    values = value if isinstance(value, list) else [value]
+    result = set()
+    for item in values:
+        if isinstance(item, str) and item.isdigit():
+            item = int(item)
+        elif isinstance(item, str) and lower:
+            item = item.lower()
+        result.add(item)
+    return result
+
+
+# 解析附加路由配置
+def parse_webhook_routes() -> List[Dict[str, Any]]:
+    """解析按项目、环境、级别附加发送目标的路由配置
+
+    格式: [{"project": "项目A", "environment": "production", "level": ["fatal", "error"], "urls": ["url1", "url2"]}]
+    project/environment/level 均可省略（表示不限制），也可以是列表；命中的规则的 urls 全部追加为发送目标
+    """
+    routes_config = os.getenv("FEISHU_WEBHOOK_ROUTES", "[]")
+    try:
+        raw_routes = json.loads(routes_config.strip() or "[]")
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to parse FEISHU_WEBHOOK_ROUTES: {e}, using no routes")
+        return []
+
+    result = []
+    for rule in raw_routes if isinstance(raw_routes, list) else []:
+        if not isinstance(rule, dict):
+            continue
+        urls = _as_url_list(rule.get("urls", rule.get("url")))
+        if not urls:
+            logger.warning(f"Ignoring webhook route without urls: {rule}")
+            continue
+        projects = _as_key_set(rule.get("project"))
+        result.append({
+            # 与项目映射使用相同的匹配方式（项目ID或名称）
+            "projects": {project: True for project in projects} if projects is not None else None,
+            "environments": _as_key_set(rule.get("environment")),
+            "levels": _as_key_set(rule.get("level"), lower=True),
+            "urls": urls,
+        })
+    return result
+
+WEBHOOK_ROUTES = parse_webhook_routes()
+
 # 解析忽略的项目ID配置
 def parse_ignore_project_ids() -> List[Any]:
     """解析忽略的项目ID配置，支持数字和字符串"""
@@ -116,21 +221,16 @@ def should_ignore_project(issue_data: Dict[str, Any]) -> bool:
     return False
 
 
-def get_project_webhook_url(issue_data: Dict[str, Any]) -> str:
-    """根据项目信息获取对应的飞书Webhook URL
-    
-    优先级:
-    1. 项目特定的URL配置
-    2. 默认的FEISHU_WEBHOOK_URL
-    """
-    if not PROJECT_WEBHOOK_MAPPING:
-        return FEISHU_WEBHOOK_URL
+def lookup_project_config(issue_data: Dict[str, Any], mapping: Dict[Any, Any]) -> Any:
+    """按项目ID或名称在配置中查找，找不到时返回 None"""
+    if not mapping:
+        return None
     
     # 提取项目信息
     project = FeishuMessage._extract_nested_value(issue_data, 'project')
     
     if project is None:
-        return FEISHU_WEBHOOK_URL
+        return None
     
     # 如果project是字典，提取ID和名称
     if isinstance(project, dict):
@@ -138,21 +238,219 @@ def get_project_webhook_url(issue_data: Dict[str, Any]) -> str:
         project_name = project.get('name', project.get('slug', ''))
         
         # 优先匹配项目ID，然后匹配项目名称
-        if project_id in PROJECT_WEBHOOK_MAPPING:
-            return PROJECT_WEBHOOK_MAPPING[project_id]
-        elif project_name in PROJECT_WEBHOOK_MAPPING:
-            return PROJECT_WEBHOOK_MAPPING[project_name]
+        if project_id in mapping:
+            return mapping[project_id]
+        elif project_name in mapping:
+            return mapping[project_name]
     
     # 如果project是数字或字符串，直接查找
     elif isinstance(project, (int, str)):
-        if project in PROJECT_WEBHOOK_MAPPING:
-            return PROJECT_WEBHOOK_MAPPING[project]
+        if project in mapping:
+            return mapping[project]
+    
+    return None
+
+
+def get_project_webhook_urls(issue_data: Dict[str, Any]) -> List[str]:
+    """根据项目信息获取对应的飞书Webhook URL列表
     
-    # 如果没有找到特定配置，返回默认URL
-    return FEISHU_WEBHOOK_URL
+    1. 项目特定的URL配置，没有时使用默认的FEISHU_WEBHOOK_URL
+    2. 追加 FEISHU_WEBHOOK_ROUTES 中命中的路由的URL
+    """
+    # 如果没有找到特定配置，使用默认URL
+    urls = list(lookup_project_config(issue_data, PROJECT_WEBHOOK_MAPPING) or _as_url_list(FEISHU_WEBHOOK_URL))
+
+    if WEBHOOK_ROUTES:
+        environment = FeishuMessage._extract_environment(issue_data)
+        level = str(FeishuMessage._extract_level(issue_data)).lower()
+        for rule in WEBHOOK_ROUTES:
+            if rule["projects"] is not None and lookup_project_config(issue_data, rule["projects"]) is None:
+                continue
+            if rule["environments"] is not None and environment not in rule["environments"]:
+                continue
+            if rule["levels"] is not None and level not in rule["levels"]:
+                continue
+            urls.extend(rule["urls"])
 
+    # 去重并保持顺序
+    return list(dict.fromkeys(urls))
+
+
+def mask_webhook_url(url: str) -> str:
+    """隐藏Webhook URL中的令牌，用完整地址的哈希前缀区分同一域名下的不同机器人"""
+    parsed_url = urlparse(url)
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:8]
+    return f"{parsed_url.scheme}://{parsed_url.netloc}/#{digest}"
+
+
+class _TemplateTags(dict):
+    """模板中的 {tags[key]}，不存在的标签显示为 Unknown"""
+
+    def __missing__(self, key: str) -> str:
+        return "Unknown"
+
+
+class _TemplateContext(dict):
+    """卡片模板变量，扩展变量只在模板用到时才从 issue 数据中提取"""
+
+    def __init__(self, issue_data: Dict[str, Any], base: Dict[str, Any]):
+        super().__init__(base)
+        self.issue_data = issue_data
+
+    def __missing__(self, key: str) -> Any:
+        resolver = CARD_TEMPLATE_RESOLVERS.get(key)
+        value = resolver(self.issue_data) if resolver else ""
+        if value is None:
+            value = "Unknown"
+        self[key] = value
+        return value
+
+
+def _resolve_template_tags(issue_data: Dict[str, Any]) -> _TemplateTags:
+    tags = FeishuMessage._extract_nested_value(issue_data, 'tags')
+    result = _TemplateTags()
+    if isinstance(tags, dict):
+        result.update(tags)
+    elif isinstance(tags, list):
+        for tag in tags:
+            if isinstance(tag, dict) and 'key' in tag:
+                result[tag['key']] = tag.get('value')
+            elif isinstance(tag, list) and len(tag) == 2:
+                result[tag[0]] = tag[1]
+    return result
+
+
+# 模板扩展变量及其提取方式
+CARD_TEMPLATE_RESOLVERS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "release": lambda issue_data: FeishuMessage._extract_nested_value(
+        issue_data, 'release.version', 'release', 'lastRelease.version'
+    ) or _resolve_template_tags(issue_data).get('release'),
+    "user_count": lambda issue_data: FeishuMessage._extract_nested_value(issue_data, 'userCount', 'user_count'),
+    "event_count": lambda issue_data: FeishuMessage._extract_nested_value(issue_data, 'count', 'times_seen'),
+    "tags": _resolve_template_tags,
+}
+
+# build_message 中直接提供的模板变量
+CARD_TEMPLATE_BASE_VARIABLES = ("project", "environment", "level", "level_emoji", "title", "culprit", "url", "message")
+
+
+_TEMPLATE_FORMATTER = string.Formatter()
+
+
+def _compile_format(text: str) -> Callable[[Dict[str, Any]], str]:
+    """校验格式字符串中的变量并预先解析为文本片段和字段，渲染时不再解析格式字符串"""
+    parts = []
+    for literal, field_name, format_spec, conversion in _TEMPLATE_FORMATTER.parse(text):
+        if field_name is None:
+            parts.append((literal, None, None, None))
+            continue
+        root = field_name.split('.', 1)[0].split('[', 1)[0]
+        if root not in CARD_TEMPLATE_BASE_VARIABLES and root not in CARD_TEMPLATE_RESOLVERS:
+            raise ValueError(f"unknown template variable: {root}")
+        # 格式说明中可以嵌套变量，如 {title:>{width}}
+        spec = _compile_format(format_spec) if "{" in format_spec else format_spec
+        parts.append((literal, field_name, spec, conversion))
+
+    def render(context: Dict[str, Any]) -> str:
+        output = []
+        for literal, field_name, spec, conversion in parts:
+            output.append(literal)
+            if field_name is None:
+                continue
+            value = _TEMPLATE_FORMATTER.get_field(field_name, (), context)[0]
+            value = _TEMPLATE_FORMATTER.convert_field(value, conversion)
+            output.append(format(value, spec if isinstance(spec, str) else spec(context)))
+        return "".join(output)
+
+    return render
+
+
+def compile_card_template(spec: Dict[str, Any]) -> Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]:
+    """将卡片模板配置编译为渲染函数
+
+    模板字段:
+    - header: 卡片标题格式字符串
+    - template: 卡片标题颜色
+    - fields: 附加字段列表，元素为变量名或 {"label": "...", "value": "格式字符串"}
+    - mentions: 需要 @ 的用户 open_id 列表，"all" 表示所有人
+    - mention_text: @ 之后的提示文字
+    - text: 附加说明（格式字符串），空间不足时可被丢弃
+    """
+    header = _compile_format(spec["header"]) if spec.get("header") else None
+    color = spec.get("template")
+
+    fields = []
+    for field in spec.get("fields", []):
+        if isinstance(field, str):
+            fields.append((field, _compile_format("{" + field + "}")))
+        else:
+            fields.append((field["label"], _compile_format(str(field["value"]))))
+
+    mention_content = None
+    if spec.get("mentions"):
+        mention_content = "".join(
+            "<at id=all></at>" if user == "all" else f"<at id={user}></at>"
+            for user in spec["mentions"]
+        ) + " " + spec.get("mention_text", "请相关同学及时处理")
+
+    text = _compile_format(spec["text"]) if spec.get("text") else None
+
+    def render(issue_data: Dict[str, Any], base: Dict[str, Any]) -> Dict[str, Any]:
+        """渲染模板，返回标题、颜色以及附加字段、@ 提醒、附加说明的文本，由 build_message 按大小上限加入卡片"""
+        context = _TemplateContext(issue_data, base)
+        return {
+            "header": FeishuMessage._truncate(header(context), 200) if header else None,
+            "template": color,
+            "fields": "\n".join(
+                f"**{label}**: {FeishuMessage._truncate(value(context), 500)}" for label, value in fields
+            ) if fields else None,
+            "mention": mention_content,
+            "extra": text(context) if text else None,
+        }
 
-if DEBUG_MODE:
+    return render
+
+
+# 解析项目卡片模板配置
+def parse_project_card_templates() -> Dict[Any, Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]]:
+    """解析项目卡片模板配置并编译，键与 PROJECT_FEISHU_WEBHOOK_MAPPING 相同（项目ID或名称）
+
+    格式: {"project_id_1": {"header": "...", "fields": [...], "mentions": [...]}, "project_name": {...}}
+    """
+    templates_config = os.getenv("PROJECT_FEISHU_CARD_TEMPLATES", "{}")
+    try:
+        raw_templates = json.loads(templates_config.strip() or "{}")
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to parse PROJECT_FEISHU_CARD_TEMPLATES: {e}, using default card")
+        return {}
+
+    if not isinstance(raw_templates, dict):
+        logger.warning("PROJECT_FEISHU_CARD_TEMPLATES must be a JSON object, using default card")
+        return {}
+
+    result = {}
+    for key, spec in raw_templates.items():
+        try:
+            result[int(key) if key.isdigit() else key] = compile_card_template(spec)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"Invalid card template for project {key}: {e}, using default card")
+    return result
+
+PROJECT_CARD_TEMPLATES = parse_project_card_templates()
+
+
+# 生产模式(python main.py --production 或 LAUNCH_MODE=production)，worker 进程通过环境变量继承
+PRODUCTION_MODE = "--production" in sys.argv or os.getenv("LAUNCH_MODE", "").lower() == "production"
+
+if PRODUCTION_MODE:
+    # 多个 worker 进程同时轮转同一个日志文件会互相覆盖，生产模式只输出到 stderr，由 Docker/supervisor/systemd 收集
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        level="DEBUG" if DEBUG_MODE else "INFO",
+        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {process} | {name}:{function}:{line} | {message}"
+    )
+elif DEBUG_MODE:
     logger.add(
         "debug.log",
         rotation="10 MB",
@@ -215,6 +513,35 @@ class FeishuMessage:
                 continue
         return None
 
+    @staticmethod
+    def _extract_frames(issue_data: Dict[str, Any]) -> Any:
+        """获取异常堆栈帧 - 支持多种可能的路径"""
+        return FeishuMessage._extract_nested_value(
+            issue_data,
+            'exception.values.0.stacktrace.frames',
+            'stacktrace.frames',
+            'entries.0.data.values.0.stacktrace.frames',
+            'data.error.exception.values.0.stacktrace.frames'
+        )
+
+    @staticmethod
+    def _extract_in_app_frames(issue_data: Dict[str, Any], limit: int) -> List[str]:
+        """提取应用代码的堆栈帧，最内层在前"""
+        frames = FeishuMessage._extract_frames(issue_data)
+        if not isinstance(frames, list):
+            return []
+        lines = []
+        for frame in reversed(frames):
+            if len(lines) >= limit:
+                break
+            if not isinstance(frame, dict) or not frame.get('in_app', False):
+                continue
+            filename = frame.get('filename') or frame.get('abs_path') or 'Unknown file'
+            function = frame.get('function') or 'Unknown function'
+            line_no = frame.get('lineno')
+            lines.append(f"{filename} in {function} at line {line_no}" if line_no else f"{filename} in {function}")
+        return lines
+
     @staticmethod
     def _extract_culprit_with_line(issue_data: Dict[str, Any]) -> str:
         """提取包含文件名和行号的位置信息"""
@@ -227,14 +554,7 @@ class FeishuMessage:
         frames = None
 
         try:
-            # 获取异常堆栈帧 - 支持多种可能的路径
-            frames = FeishuMessage._extract_nested_value(
-                issue_data,
-                'exception.values.0.stacktrace.frames',
-                'stacktrace.frames',
-                'entries.0.data.values.0.stacktrace.frames',
-                'data.error.exception.values.0.stacktrace.frames'
-            )
+            frames = FeishuMessage._extract_frames(issue_data)
 
             if frames and isinstance(frames, list):
                 # 查找 in_app 为 true 的帧（应用代码）
@@ -397,13 +717,19 @@ class FeishuMessage:
             return "Unknown Project"
 
     @staticmethod
-    def build_message(issue_data: Dict[str, Any]) -> Dict[str, Any]:
-        # 调试：记录完整的数据结构
-        logger.debug(f"Raw issue data keys: {list(issue_data.keys())}")
+    def _extract_level(issue_data: Dict[str, Any]) -> str:
+        """提取级别"""
+        return FeishuMessage._extract_nested_value(
+            issue_data,
+            'level',
+            'metadata.level',
+            'tags.level'
+        ) or "error"
 
-        # 从 Sentry webhook 数据中提取信息
-        # 标题可以从多个位置获取
-        title = FeishuMessage._extract_nested_value(
+    @staticmethod
+    def _extract_title(issue_data: Dict[str, Any]) -> str:
+        """提取标题，标题可以从多个位置获取"""
+        return FeishuMessage._extract_nested_value(
             issue_data,
             'title',
             'metadata.value',
@@ -412,6 +738,91 @@ class FeishuMessage:
             'exception.values.0.value'
         ) or "Unknown Issue"
 
+    @staticmethod
+    def build_storm_summary(project_name: str, rate: int, window_seconds: int,
+                            top_issues: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """告警风暴期间发送的摘要卡片"""
+        lines = [f"- {FeishuMessage._truncate(str(item['title']), 100)} ({item['count']})" for item in top_issues] or ["- 无"]
+        return {
+            "msg_type": "interactive",
+            "card": {
+                "config": {
+                    "wide_screen_mode": True
+                },
+                "header": {
+                    "title": {
+                        "content": f"🌪️ Sentry 告警风暴: {project_name}",
+                        "tag": "plain_text"
+                    },
+                    "template": "purple"
+                },
+                "elements": [
+                    {
+                        "tag": "div",
+                        "text": {
+                            "content": f"**项目**: {project_name}\n**最近 {window_seconds} 秒事件数**: {rate}\n已切换为摘要模式，单条告警暂停发送",
+                            "tag": "lark_md"
+                        }
+                    },
+                    {
+                        "tag": "div",
+                        "text": {
+                            "content": "**高频 Issue**:\n" + "\n".join(lines),
+                            "tag": "lark_md"
+                        }
+                    },
+                    {
+                        "tag": "note",
+                        "elements": [
+                            {
+                                "tag": "plain_text",
+                                "content": f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                            }
+                        ]
+                    }
+                ]
+            }
+        }
+
+    @staticmethod
+    def encode(message: Dict[str, Any]) -> bytes:
+        """按实际发送的格式序列化消息"""
+        return json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def _truncate(text: str, max_chars: int) -> str:
+        if len(text) > max_chars:
+            return text[:max(max_chars - 3, 0)] + "..."
+        return text
+
+    @staticmethod
+    def _fit_text_element(prefix: str, text: str, budget: int) -> Optional[Dict[str, Any]]:
+        """在 budget 字节内构建 div 元素，放不下时截断 text，连前缀都放不下时返回 None"""
+        def element(content: str) -> Dict[str, Any]:
+            return {"tag": "div", "text": {"content": prefix + content, "tag": "lark_md"}}
+
+        size = len(FeishuMessage.encode(element(text)))
+        while size > budget:
+            # 按超出比例估算可保留的字符数，转义字符和多字节字符会导致估算偏大，因此循环收敛
+            keep = int(len(text) * budget / size) - 4
+            if keep <= 0:
+                return None
+            text = text[:keep] + "..."
+            size = len(FeishuMessage.encode(element(text)))
+        return element(text)
+
+    @staticmethod
+    def build_message(issue_data: Dict[str, Any], max_bytes: int = None) -> Dict[str, Any]:
+        """构建飞书卡片，按字节数上限依次加入模板 @ 提醒和附加字段、查看详情按钮、详情、模板附加说明、堆栈，放不下的内容截断或丢弃"""
+        if max_bytes is None:
+            max_bytes = FEISHU_CARD_MAX_BYTES
+
+        # 调试：记录完整的数据结构
+        logger.debug(f"Raw issue data keys: {list(issue_data.keys())}")
+
+        # 从 Sentry webhook 数据中提取信息，单个字段先限制长度
+        title = FeishuMessage._truncate(str(FeishuMessage._extract_title(issue_data)), 500)
+
         # URL 可以从多个位置获取
         url = FeishuMessage._extract_nested_value(
             issue_data,
@@ -421,21 +832,16 @@ class FeishuMessage:
         ) or ""
 
         # 提取项目名称
-        project_name = FeishuMessage._extract_project_name(issue_data)
+        project_name = FeishuMessage._truncate(FeishuMessage._extract_project_name(issue_data), 100)
 
         # 提取环境信息
-        environment = FeishuMessage._extract_environment(issue_data)
+        environment = FeishuMessage._truncate(str(FeishuMessage._extract_environment(issue_data)), 100)
 
         # 提取级别
-        level = FeishuMessage._extract_nested_value(
-            issue_data,
-            'level',
-            'metadata.level',
-            'tags.level'
-        ) or "error"
+        level = FeishuMessage._extract_level(issue_data)
 
         # 提取包含行号的位置信息
-        culprit = FeishuMessage._extract_culprit_with_line(issue_data)
+        culprit = FeishuMessage._truncate(FeishuMessage._extract_culprit_with_line(issue_data), 500)
 
         # 提取消息详情
         message = FeishuMessage._extract_nested_value(
@@ -445,10 +851,8 @@ class FeishuMessage:
             'exception.values.0.value',
             'title'
         ) or "No message provided"
-
-        # 如果消息太长，截断
-        if isinstance(message, str) and len(message) > 300:
-            message = message[:297] + "..."
+        # 先限制长度，模板中使用的 message 同样受限
+        message = FeishuMessage._truncate(str(message), 1000)
 
         level_emoji = {
             "fatal": "🔴",
@@ -458,6 +862,25 @@ class FeishuMessage:
             "debug": "⚪"
         }.get(level.lower(), "⚫")
 
+        # 项目自定义卡片模板（启动时已编译）
+        rendered = None
+        template = lookup_project_config(issue_data, PROJECT_CARD_TEMPLATES)
+        if template is not None:
+            try:
+                rendered = template(issue_data, {
+                    "project": project_name,
+                    "environment": environment,
+                    "level": level,
+                    "level_emoji": level_emoji,
+                    "title": title,
+                    "culprit": culprit,
+                    "url": FeishuMessage._truncate(url, 500),
+                    "message": message,
+                })
+            except Exception as e:
+                # 格式说明与实际值不匹配等渲染错误，回退到默认卡片
+                logger.warning(f"Failed to render card template, using default card: {e}")
+
         # 构建消息内容
         msg_content = {
             "msg_type": "interactive",
@@ -467,128 +890,947 @@ class FeishuMessage:
                 },
                 "header": {
                     "title": {
-                        "content": f"{level_emoji} Sentry Issue Alert",
+                        "content": (rendered and rendered["header"]) or f"{level_emoji} Sentry Issue Alert",
                         "tag": "plain_text"
                     },
-                    "template": "red" if level.lower() in ["fatal", "error"] else "orange" if level.lower() == "warning" else "blue"
+                    "template": (rendered and rendered["template"]) or (
+                        "red" if level.lower() in ["fatal", "error"] else "orange" if level.lower() == "warning" else "blue"
+                    )
                 },
-                "elements": [
-                    {
-                        "tag": "div",
-                        "text": {
-                            "content": f"**项目**: {project_name}\n**环境**: {environment}\n**级别**: {level.upper()}",
-                            "tag": "lark_md"
-                        }
-                    },
-                    {
-                        "tag": "div",
-                        "text": {
-                            "content": f"**标题**: {title}\n**位置**: {culprit}",
-                            "tag": "lark_md"
-                        }
-                    },
-                    {
-                        "tag": "hr"
-                    }
-                    # 注释@所有人
-                    # , {
-                    #     "tag": "div",
-                    #     "text": {
-                    #         "content": "<at id=all></at> 请相关同学及时处理",
-                    #         "tag": "lark_md"
-                    #     }
-                    # }
-                ]
+                "elements": []
             }
         }
+        # 必需部分: 基本信息、标题位置、分隔线、时间
+        head_elements = [
+            {
+                "tag": "div",
+                "text": {
+                    "content": f"**项目**: {project_name}\n**环境**: {environment}\n**级别**: {level.upper()}",
+                    "tag": "lark_md"
+                }
+            },
+            {
+                "tag": "div",
+                "text": {
+                    "content": f"**标题**: {title}\n**位置**: {culprit}",
+                    "tag": "lark_md"
+                }
+            },
+            {
+                "tag": "hr"
+            }
+        ]
+        note_element = {
+            "tag": "note",
+            "elements": [
+                {
+                    "tag": "plain_text",
+                    "content": f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                }
+            ]
+        }
 
-        # 只有在 message 不为空时才添加详情部分
-        if message and message != "" and message != "No message provided":
-            msg_content["card"]["elements"].append({
+        # 元素之间以逗号分隔，整体大小 = 骨架 + 各元素 + 分隔符
+        size = len(FeishuMessage.encode(msg_content))
+        for element in head_elements + [note_element]:
+            size += len(FeishuMessage.encode(element)) + 1
+        size -= 1
+
+        def take(element: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            nonlocal size
+            if element is None:
+                return None
+            element_size = len(FeishuMessage.encode(element)) + 1
+            if size + element_size > max_bytes:
+                return None
+            size += element_size
+            return element
+
+        # 可选部分按优先级依次加入: 模板 @ 提醒 > 模板附加字段 > 查看详情按钮 > 详情 > 模板附加说明 > 堆栈
+        mention_element = None
+        fields_element = None
+        if rendered and rendered["mention"]:
+            mention_element = take({
                 "tag": "div",
                 "text": {
-                    "content": f"**详情**: {message}",
+                    "content": rendered["mention"],
                     "tag": "lark_md"
                 }
             })
+        if rendered and rendered["fields"]:
+            fields_element = take(FeishuMessage._fit_text_element("", rendered["fields"], max_bytes - size - 1))
 
-        # 只有在有有效 URL 时才添加查看详情按钮
+        action_element = None
         if url and url.startswith(('http://', 'https://')):
-            msg_content["card"]["elements"].extend([
-                {
-                    "tag": "action",
-                    "actions": [
-                        {
-                            "tag": "button",
-                            "text": {
-                                "tag": "plain_text",
-                                "content": "查看详情"
-                            },
-                            "type": "primary",
-                            "url": url
-                        }
-                    ]
-                },
-                {
-                    "tag": "note",
-                    "elements": [
-                        {
-                            "tag": "plain_text",
-                            "content": f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                        }
-                    ]
-                }
-            ])
-        else:
-            msg_content["card"]["elements"].append({
-                "tag": "note",
-                "elements": [
+            action_element = take({
+                "tag": "action",
+                "actions": [
                     {
-                        "tag": "plain_text",
-                        "content": f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                        "tag": "button",
+                        "text": {
+                            "tag": "plain_text",
+                            "content": "查看详情"
+                        },
+                        "type": "primary",
+                        "url": url
                     }
                 ]
             })
 
+        # 只有在 message 不为空时才添加详情部分，过长时截断
+        message_element = None
+        if message and message != "" and message != "No message provided":
+            message_element = take(FeishuMessage._fit_text_element("**详情**: ", message, max_bytes - size - 1))
+
+        extra_element = None
+        if rendered and rendered["extra"]:
+            extra_element = take(FeishuMessage._fit_text_element("", rendered["extra"], max_bytes - size - 1))
+
+        frames_element = None
+        frame_lines = FeishuMessage._extract_in_app_frames(issue_data, FEISHU_CARD_MAX_FRAMES)
+        # 只有一帧时已体现在位置信息中
+        if len(frame_lines) > 1:
+            while frame_lines and frames_element is None:
+                frames_element = take({
+                    "tag": "div",
+                    "text": {
+                        "content": "**堆栈**:\n" + "\n".join(FeishuMessage._truncate(line, 300) for line in frame_lines),
+                        "tag": "lark_md"
+                    }
+                })
+                frame_lines.pop()
+
+        # 模板附加字段和 @ 提醒位于标题之后、分隔线之前（默认卡片不 @ 所有人）
+        msg_content["card"]["elements"] = head_elements[:2] + [
+            element for element in (fields_element, mention_element)
+            if element is not None
+        ] + head_elements[2:] + [
+            element for element in (message_element, extra_element, frames_element, action_element, note_element)
+            if element is not None
+        ]
+
+        if size > max_bytes:
+            logger.warning(f"Feishu card still exceeds size limit: {size} > {max_bytes} bytes")
+
         return msg_content
 
 
-class WebhookHandler:
-    def __init__(self):
-        self.client = httpx.AsyncClient(
-            timeout=30.0,
-            proxies=None
+class PayloadAdapter:
+    """Sentry webhook 负载适配器
+
+    每种资源类型（Sentry-Hook-Resource）对应一个适配器，只负责提取自己格式中的 issue 数据。
+    actions 为 None 表示不按 action 过滤，空元组表示该资源整体忽略。
+    """
+    resource: str = ""
+    actions: Optional[Tuple[str, ...]] = ("created",)
+    default_action: str = "unknown"
+
+    def accepts(self, action: str) -> bool:
+        return self.actions is None or action in self.actions
+
+    def detect(self, data: Dict[str, Any]) -> bool:
+        """没有 Sentry-Hook-Resource 请求头时，根据负载结构判断是否属于该适配器"""
+        return False
+
+    def extract(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """提取 issue 数据，返回 None 表示负载无效"""
+        return None
+
+    def delivery_key(self, data: Dict[str, Any]) -> Optional[str]:
+        """同一次投递的去重键，Sentry 重试时不变；负载中没有 event_id 时返回 None"""
+        event_id = FeishuMessage._extract_nested_value(
+            data,
+            'data.event.event_id',
+            'data.error.event_id',
+            'event.event_id',
+            'event_id'
         )
+        if not event_id:
+            return None
+        return f"{self.resource}:{event_id}"
+
+
+# 按资源类型注册的适配器，注册顺序即无请求头时的探测顺序
+PAYLOAD_ADAPTERS: Dict[str, PayloadAdapter] = {}
+
+
+def register_payload_adapter(adapter_cls: Type[PayloadAdapter]) -> Type[PayloadAdapter]:
+    adapter = adapter_cls()
+    PAYLOAD_ADAPTERS[adapter.resource] = adapter
+    return adapter_cls
+
+
+def detect_payload_adapter(data: Dict[str, Any]) -> Optional[PayloadAdapter]:
+    for adapter in PAYLOAD_ADAPTERS.values():
+        if adapter.detect(data):
+            return adapter
+    return None
+
+
+@register_payload_adapter
+class ErrorAdapter(PayloadAdapter):
+    """错误事件: data.error"""
+    resource = "error"
+
+    def detect(self, data: Dict[str, Any]) -> bool:
+        return isinstance(data.get("data"), dict) and "error" in data["data"]
+
+    def extract(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return FeishuMessage._extract_nested_value(data, 'data.error')
+
+
+@register_payload_adapter
+class EventAlertAdapter(PayloadAdapter):
+    """告警规则触发: data.event"""
+    resource = "event_alert"
+    actions = ("triggered",)
+
+    def detect(self, data: Dict[str, Any]) -> bool:
+        return isinstance(data.get("data"), dict) and "event" in data["data"]
+
+    def extract(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return FeishuMessage._extract_nested_value(data, 'data.event')
+
+    def delivery_key(self, data: Dict[str, Any]) -> Optional[str]:
+        # 同一事件触发多条告警规则时分别投递，按规则区分
+        key = super().delivery_key(data)
+        if key is None:
+            return None
+        return f"{key}:{FeishuMessage._extract_nested_value(data, 'data.triggered_rule')}"
+
+
+@register_payload_adapter
+class MetricAlertAdapter(PayloadAdapter):
+    """指标告警: data.metric_alert，只提取卡片需要的字段"""
+    resource = "metric_alert"
+    actions = ("critical", "warning")
+
+    def detect(self, data: Dict[str, Any]) -> bool:
+        return isinstance(data.get("data"), dict) and "metric_alert" in data["data"]
+
+    def extract(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        alert_data = data.get("data") or {}
+        metric_alert = alert_data.get("metric_alert") or {}
+        projects = FeishuMessage._extract_nested_value(
+            metric_alert,
+            'projects',
+            'alert_rule.projects'
+        ) or []
+        return {
+            "title": alert_data.get("description_title") or metric_alert.get("title"),
+            "message": alert_data.get("description_text"),
+            "web_url": alert_data.get("web_url"),
+            "level": "fatal" if data.get("action") == "critical" else "warning",
+            "project": projects[0] if isinstance(projects, list) and projects else None,
+        }
+
+
+@register_payload_adapter
+class InstallationAdapter(PayloadAdapter):
+    """集成安装/卸载通知，不需要发送飞书消息"""
+    resource = "installation"
+    actions = ()
+
+    def detect(self, data: Dict[str, Any]) -> bool:
+        return isinstance(data.get("data"), dict) and "installation" in data["data"]
+
+    def extract(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return None
+
+
+@register_payload_adapter
+class IssueAdapter(PayloadAdapter):
+    """Issue 事件: data.issue，兼容直接放在 data 中的数据"""
+    resource = "issue"
+
+    def detect(self, data: Dict[str, Any]) -> bool:
+        return isinstance(data.get("data"), dict)
+
+    def extract(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        payload = data.get("data")
+        # 只有缺少 issue 字段时才回退到 data 本身，issue 为 null 时视为无效数据
+        if isinstance(payload, dict) and "issue" in payload:
+            return payload["issue"]
+        return payload
+
+
+@register_payload_adapter
+class PluginAdapter(PayloadAdapter):
+    """旧版 Webhooks 插件格式: 字段直接位于顶层"""
+    resource = "plugin"
+    actions = None
+    default_action = "direct"
+
+    def detect(self, data: Dict[str, Any]) -> bool:
+        return "id" in data and ("message" in data or "title" in data)
+
+    def extract(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return data
+
+
+class CountMinSketch:
+    """固定内存的计数草图，估计值只会偏大不会偏小"""
+
+    # 每行使用不同的奇数乘子做 multiply-shift 哈希，保证各行之间相互独立
+    _MULTIPLIERS = (
+        0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+        0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9,
+    )
 
-    async def send_to_feishu(self, issue_data: Dict[str, Any], webhook_url: str = None) -> bool:
+    def __init__(self, width: int, depth: int):
+        # 宽度取 2 的幂，行数不超过乘子数量
+        self.bits = max(width - 1, 1).bit_length()
+        self.width = 1 << self.bits
+        self.depth = min(depth, len(self._MULTIPLIERS))
+        self.rows = [[0] * self.width for _ in range(self.depth)]
+
+    def indexes(self, key: str) -> List[int]:
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        shift = 64 - self.bits
+        return [((h * self._MULTIPLIERS[row]) & 0xFFFFFFFFFFFFFFFF) >> shift for row in range(self.depth)]
+
+    def add(self, indexes: List[int], count: int = 1) -> None:
+        for row, index in enumerate(indexes):
+            self.rows[row][index] += count
+
+    def estimate(self, indexes: List[int]) -> int:
+        return min(self.rows[row][index] for row, index in enumerate(indexes))
+
+    def clear(self) -> None:
+        for row in self.rows:
+            row[:] = [0] * self.width
+
+
+class SlidingWindowSketch:
+    """由多个子窗口草图组成的滑动窗口计数，过期子窗口整体清零"""
+
+    def __init__(self, window_seconds: int, buckets: int = 6, width: int = 2048, depth: int = 4):
+        self.bucket_seconds = max(window_seconds, 1) / buckets
+        self.sketches = [CountMinSketch(width, depth) for _ in range(buckets)]
+        self.current = int(time.monotonic() // self.bucket_seconds)
+
+    def _advance(self, now: float) -> None:
+        bucket = int(now // self.bucket_seconds)
+        if bucket == self.current:
+            return
+        for step in range(1, min(bucket - self.current, len(self.sketches)) + 1):
+            self.sketches[(self.current + step) % len(self.sketches)].clear()
+        self.current = bucket
+
+    def add(self, key: str, now: float) -> int:
+        """计数并返回窗口内的估计值"""
+        self._advance(now)
+        indexes = self.sketches[0].indexes(key)
+        self.sketches[self.current % len(self.sketches)].add(indexes)
+        return sum(sketch.estimate(indexes) for sketch in self.sketches)
+
+    def estimate(self, key: str, now: float) -> int:
+        self._advance(now)
+        indexes = self.sketches[0].indexes(key)
+        return sum(sketch.estimate(indexes) for sketch in self.sketches)
+
+
+class AlertStormDetector:
+    """告警风暴检测
+
+    按项目和 issue 指纹统计滑动窗口内的事件数，候选高频 issue 数量固定，
+    内存占用与出现过的 issue 数量无关。项目事件数超过阈值时进入摘要模式，
+    每个窗口最多发送一次摘要。
+    """
+
+    def __init__(self, window_seconds: int, threshold: int, top_k: int):
+        self.window_seconds = window_seconds
+        self.threshold = threshold
+        self.top_k = top_k
+        self.capacity = max(top_k, 1) * 4
+        self.sketch = SlidingWindowSketch(window_seconds)
+        # 指纹 -> [项目名称, 标题, 最近一次估计值, 最近一次出现时间]
+        self.candidates: Dict[str, List[Any]] = {}
+        # 项目名称 -> 上次发送摘要的时间
+        self.storm_projects: Dict[str, float] = {}
+
+    @staticmethod
+    def fingerprint(issue_data: Dict[str, Any], project_name: str, title: str) -> str:
+        issue_id = FeishuMessage._extract_nested_value(issue_data, 'issue_id', 'groupID', 'id')
+        return f"{project_name}|{issue_id if issue_id is not None else title}"
+
+    def _track_candidate(self, fingerprint: str, project_name: str, title: str, count: int, now: float) -> None:
+        candidate = self.candidates.get(fingerprint)
+        if candidate is not None:
+            candidate[2] = count
+            candidate[3] = now
+            return
+        if len(self.candidates) >= self.capacity:
+            # 淘汰估计值最小的候选，超过一个窗口未出现的候选视为 0
+            def weight(fp: str) -> int:
+                item = self.candidates[fp]
+                return item[2] if now - item[3] < self.window_seconds else 0
+
+            weakest = min(self.candidates, key=weight)
+            if weight(weakest) >= count:
+                return
+            del self.candidates[weakest]
+        self.candidates[fingerprint] = [project_name, title, count, now]
+
+    def observe(self, issue_data: Dict[str, Any]) -> Dict[str, Any]:
+        """记录一次事件，返回项目当前的事件数以及是否处于风暴、是否需要发送摘要"""
+        now = time.monotonic()
+        project_name = FeishuMessage._extract_project_name(issue_data)
+        title = FeishuMessage._extract_title(issue_data)
+        fingerprint = self.fingerprint(issue_data, project_name, title)
+
+        rate = self.sketch.add(f"p:{project_name}", now)
+        count = self.sketch.add(f"i:{fingerprint}", now)
+        self._track_candidate(fingerprint, project_name, title, count, now)
+
+        result = {"project": project_name, "rate": rate, "storm": False, "send_summary": False}
+        if self.threshold <= 0 or rate < self.threshold:
+            self.storm_projects.pop(project_name, None)
+            return result
+
+        result["storm"] = True
+        last_summary = self.storm_projects.get(project_name)
+        if last_summary is None:
+            if len(self.storm_projects) >= self.capacity:
+                self._expire_storms(now)
+            if len(self.storm_projects) >= self.capacity:
+                # 风暴项目过多时不再记录新项目，只抑制单条告警
+                return result
+            logger.warning(f"Project {project_name} entered alert storm: {rate} events in {self.window_seconds}s")
+        if last_summary is None or now - last_summary >= self.window_seconds:
+            self.storm_projects[project_name] = now
+            result["send_summary"] = True
+        return result
+
+    def _expire_storms(self, now: float) -> None:
+        for project_name in list(self.storm_projects):
+            if self.sketch.estimate(f"p:{project_name}", now) < self.threshold:
+                del self.storm_projects[project_name]
+
+    def top_issues(self, project_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        items = []
+        for fingerprint, (project, title, _, _) in self.candidates.items():
+            if project_name is not None and project != project_name:
+                continue
+            count = self.sketch.estimate(f"i:{fingerprint}", now)
+            if count > 0:
+                items.append({"fingerprint": fingerprint, "project": project, "title": title, "count": count})
+        items.sort(key=lambda item: item["count"], reverse=True)
+        return items[:self.top_k]
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        if self.threshold > 0:
+            self._expire_storms(now)
+        return {
+            "window_seconds": self.window_seconds,
+            "threshold": self.threshold,
+            "storm_projects": [
+                {"project": project, "rate": self.sketch.estimate(f"p:{project}", now)}
+                for project in self.storm_projects
+            ],
+            "top_issues": self.top_issues(),
+        }
+
+
+alert_storm_detector = AlertStormDetector(ALERT_STORM_WINDOW_SECONDS, ALERT_STORM_THRESHOLD, ALERT_STORM_TOP_K)
+
+
+class RequestTiming:
+    """单个请求内各处理阶段的耗时记录"""
+
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
         try:
-            # 如果没有提供webhook_url，则根据项目获取对应的URL
-            if webhook_url is None:
-                webhook_url = get_project_webhook_url(issue_data)
-            
-            if not webhook_url or not webhook_url.startswith(('http://', 'https://')):
-                logger.error(f"Invalid webhook URL: '{webhook_url}'")
-                return False
+            yield
+        finally:
+            self.spans.append((name, (time.perf_counter() - start) * 1000))
+
+    def server_timing(self) -> str:
+        """格式化为 Server-Timing 响应头"""
+        return ", ".join(f"{name};dur={duration:.3f}" for name, duration in self.spans)
+
+
+_current_timing: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar("current_timing", default=None)
 
+
+@contextmanager
+def timing_span(name: str):
+    """记录当前请求某个阶段的耗时，不在请求上下文中时不做任何事"""
+    timing = _current_timing.get()
+    if timing is None:
+        yield
+        return
+    with timing.span(name):
+        yield
+
+
+class SamplingProfiler:
+    """采样分析器: 在后台线程定时抓取事件循环线程的调用栈并聚合
+
+    事件循环空闲（等待 IO）时的样本只计数，不计入调用栈，避免掩盖处理请求的耗时。
+    """
+
+    # 协程和异步生成器的帧，位于这些帧之外的是驱动事件循环的帧
+    _ASYNC_FLAGS = inspect.CO_COROUTINE | inspect.CO_ITERABLE_COROUTINE | inspect.CO_ASYNC_GENERATOR
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    @classmethod
+    def _loop_driver_codes(cls) -> Set[Any]:
+        """当前任务之外驱动事件循环的帧，采样时只停留在这些帧上说明事件循环空闲"""
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_code.co_flags & cls._ASYNC_FLAGS:
+            frame = frame.f_back
+        codes = set()
+        while frame is not None:
+            codes.add(frame.f_code)
+            frame = frame.f_back
+        return codes
+
+    def _sample(self, thread_id: int, driver_codes: Set[Any], seconds: float, stacks: Counter) -> int:
+        idle = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            # asyncio 事件循环空闲时阻塞在 selectors 中，uvloop 空闲时停留在驱动帧上
+            top = frame
+            while top is not None and os.path.basename(top.f_code.co_filename) == "selectors.py":
+                top = top.f_back
+            if top is None or top.f_code in driver_codes:
+                idle += 1
+            else:
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        return idle
+
+    async def capture(self, seconds: float, limit: int = 50) -> Dict[str, Any]:
+        async with self._lock:
+            stacks: Counter = Counter()
+            # 在事件循环线程中确定采样目标，执行器等空闲线程不参与采样
+            thread_id = threading.get_ident()
+            driver_codes = self._loop_driver_codes()
+            idle = await asyncio.to_thread(self._sample, thread_id, driver_codes, seconds, stacks)
+
+        own_samples: Counter = Counter()
+        total_samples: Counter = Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")
+            own_samples[frames[-1].rsplit(":", 1)[0]] += count
+            for function in {frame.rsplit(":", 1)[0] for frame in frames}:
+                total_samples[function] += count
+
+        return {
+            "seconds": seconds,
+            "interval_ms": self.interval * 1000,
+            "samples": sum(stacks.values()),
+            "idle_samples": idle,
+            "top_functions": [
+                {"function": function, "self": count, "total": total_samples[function]}
+                for function, count in own_samples.most_common(limit)
+            ],
+            # collapsed stack 格式，可直接用于生成火焰图
+            "stacks": [{"stack": stack, "count": count} for stack, count in stacks.most_common(limit)],
+        }
+
+
+profiler = SamplingProfiler()
+
+
+class IdempotencyCache:
+    """Sentry 投递的幂等缓存（LRU + TTL）
+
+    以投递的事件（资源类型、告警规则和 event_id）或 Request-ID 为键保存处理结果，处理中的投递保存为 Future，
+    重复投递直接等待并返回原结果。处理失败的投递不缓存，以便 Sentry 重试。
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # 键 -> (过期时间, 处理结果的 Future)
+        self._entries: "OrderedDict[str, Tuple[float, asyncio.Future]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[asyncio.Future]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def start(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (time.monotonic() + self.ttl, future)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return future
+
+    def finish(self, key: str, future: asyncio.Future, result: Dict[str, Any]) -> None:
+        if not future.done():
+            future.set_result(result)
+
+    def fail(self, key: str, future: asyncio.Future, error: BaseException) -> None:
+        if self._entries.get(key, (None, None))[1] is future:
+            del self._entries[key]
+        if not future.done():
+            if not isinstance(error, Exception):
+                # 原请求被取消时，等待中的重复投递返回错误以便 Sentry 再次重试
+                error = RuntimeError("Original delivery was cancelled")
+            future.set_exception(error)
+            # 没有重复投递在等待时，避免 "exception was never retrieved"
+            future.exception()
+
+    async def run(self, key: str, future: asyncio.Future, awaitable) -> Dict[str, Any]:
+        """执行处理并记录结果，任何方式退出（包括被取消）都会结束 Future，不会让重复投递一直等待"""
+        try:
+            result = await awaitable
+        except BaseException as e:
+            self.fail(key, future, e)
+            raise
+        self.finish(key, future, result)
+        return result
+
+
+idempotency_cache = IdempotencyCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SECONDS)
+
+
+class SentryEnricher:
+    """从 Sentry API 获取 issue 最新事件，补充缺少堆栈的负载（如旧版插件格式）
+
+    结果按 issue ID 缓存（LRU + TTL，获取失败按较短的 failure_ttl 缓存以免反复等待），同一 issue 的并发请求共用一次获取。
+    每次补充最多等待 timeout 秒，超时后按原数据发送，后台获取完成后结果仍会写入缓存。
+    """
+
+    def __init__(self, api_url: str, token: str, timeout: float, ttl: float, failure_ttl: float, maxsize: int):
+        self.api_url = api_url
+        self.token = token
+        self.timeout = timeout
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.maxsize = maxsize
+        self.enabled = bool(api_url and token)
+        self.client = httpx.AsyncClient(timeout=10.0) if self.enabled else None
+        # issue ID -> (过期时间, 补充数据或 None)
+        self._cache: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def _cache_get(self, issue_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        entry = self._cache.get(issue_id)
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        self._cache.move_to_end(issue_id)
+        return True, entry[1]
+
+    def _cache_put(self, issue_id: str, value: Optional[Dict[str, Any]]) -> None:
+        # 获取失败多为暂时性错误，只短暂缓存，避免一次失败使该 issue 长时间无法补充
+        ttl = self.ttl if value is not None else self.failure_ttl
+        self._cache[issue_id] = (time.monotonic() + ttl, value)
+        self._cache.move_to_end(issue_id)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _parse_event(event: Dict[str, Any]) -> Dict[str, Any]:
+        """只保留卡片需要的字段: 应用代码堆栈帧和标签"""
+        frames = []
+        for entry in event.get("entries") or []:
+            if isinstance(entry, dict) and entry.get("type") == "exception":
+                values = FeishuMessage._extract_nested_value(entry, 'data.values') or []
+                if values and isinstance(values[-1], dict):
+                    frames = FeishuMessage._extract_nested_value(values[-1], 'stacktrace.frames') or []
+                break
+        if isinstance(frames, list) and frames:
+            # 保留应用代码帧以及最内层的帧，控制缓存占用
+            frames = [
+                {key: frame.get(key) for key in ("filename", "abs_path", "function", "lineno", "in_app")}
+                for index, frame in enumerate(frames)
+                if isinstance(frame, dict) and (frame.get("in_app") or index == len(frames) - 1)
+            ][-FEISHU_CARD_MAX_FRAMES - 1:]
+        return {"frames": frames, "tags": event.get("tags") or []}
+
+    async def _fetch(self, issue_id: str) -> Optional[Dict[str, Any]]:
+        result = None
+        try:
+            response = await self.client.get(
+                f"{self.api_url}/api/0/issues/{issue_id}/events/latest/",
+                headers={"Authorization": f"Bearer {self.token}"}
+            )
+            if response.status_code == 200:
+                result = self._parse_event(response.json())
+            else:
+                logger.warning(f"Sentry API error for issue {issue_id}: {response.status_code}")
+        except Exception as e:
+            # 网络错误、非 JSON 或结构不符合预期的响应都按获取失败处理
+            logger.warning(f"Failed to fetch latest event for issue {issue_id}: {e!r}")
+        finally:
+            self._inflight.pop(issue_id, None)
+        self._cache_put(issue_id, result)
+        return result
+
+    async def enrich(self, issue_data: Dict[str, Any]) -> Dict[str, Any]:
+        """返回补充了堆栈和标签的 issue 数据副本，无需或无法补充时返回原数据"""
+        if not self.enabled or FeishuMessage._extract_frames(issue_data):
+            return issue_data
+        issue_id = FeishuMessage._extract_nested_value(issue_data, 'issue_id', 'groupID', 'id')
+        if issue_id is None:
+            return issue_data
+        issue_id = str(issue_id)
+
+        found, extra = self._cache_get(issue_id)
+        if not found:
+            task = self._inflight.get(issue_id)
+            if task is None:
+                task = asyncio.ensure_future(self._fetch(issue_id))
+                self._inflight[issue_id] = task
             try:
-                message = FeishuMessage.build_message(issue_data)
-                if DEBUG_MODE:
-                    logger.debug(f"Built message: {json.dumps(message, indent=2, ensure_ascii=False)}")
+                extra = await asyncio.wait_for(asyncio.shield(task), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                logger.info(f"Enrichment for issue {issue_id} exceeded {self.timeout}s, sending without it")
+                return issue_data
             except Exception as e:
-                logger.error(f"Failed to build message: {str(e)}")
-                logger.error(f"Issue data keys: {list(issue_data.keys())}")
-                return False
+                logger.warning(f"Enrichment for issue {issue_id} failed, sending without it: {e!r}")
+                return issue_data
+
+        if not extra:
+            return issue_data
+        enriched = dict(issue_data)
+        if extra["frames"]:
+            enriched["stacktrace"] = {"frames": extra["frames"]}
+        if extra["tags"] and not issue_data.get("tags"):
+            enriched["tags"] = extra["tags"]
+        return enriched
+
+    async def close(self) -> None:
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self.client is not None:
+            await self.client.aclose()
+
+
+sentry_enricher = SentryEnricher(
+    SENTRY_API_URL,
+    SENTRY_API_TOKEN,
+    SENTRY_ENRICH_TIMEOUT,
+    SENTRY_ENRICH_TTL_SECONDS,
+    SENTRY_ENRICH_FAILURE_TTL_SECONDS,
+    SENTRY_ENRICH_CACHE_SIZE
+)
+
+
+class _Destination:
+    """单个 Webhook 地址的发送队列"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.queue: deque = deque()
+        self.inflight = 0
+        self.in_ring = False
+
+
+class DeliveryScheduler:
+    """按 Webhook 地址隔离的发送调度
+
+    每个地址有独立的队列和并发上限，调度时在有待发送消息的地址之间轮询，
+    某个飞书机器人变慢或被限流时只会积压自己的队列，不影响其他项目。
+    """
 
-            # 记录使用的Webhook URL（仅记录域名部分以保护隐私）
-            from urllib.parse import urlparse
-            parsed_url = urlparse(webhook_url)
-            logger.info(f"Sending to Feishu webhook: {parsed_url.scheme}://{parsed_url.netloc}/...")
+    def __init__(self, client: httpx.AsyncClient, max_concurrency: int,
+                 destination_concurrency: int, queue_size: int):
+        self.client = client
+        self.max_concurrency = max(max_concurrency, 1)
+        self.destination_concurrency = max(destination_concurrency, 1)
+        self.queue_size = queue_size
+        self.destinations: Dict[str, _Destination] = {}
+        # 有待发送消息的地址，按轮询顺序排列
+        self._ring: deque = deque()
+        self._active = 0
+        # 排队中和发送中的消息，关闭服务时等待其完成
+        self._outstanding: Set[asyncio.Future] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, url: str, content: bytes) -> asyncio.Future:
+        """提交一次发送，返回飞书响应的 Future；队列已满时立即失败"""
+        destination = self.destinations.get(url)
+        if destination is None:
+            destination = self.destinations[url] = _Destination(url)
+
+        future = asyncio.get_running_loop().create_future()
+        if len(destination.queue) >= self.queue_size:
+            future.set_exception(RuntimeError(f"Feishu destination queue is full ({self.queue_size})"))
+            return future
+
+        destination.queue.append((content, future))
+        self._outstanding.add(future)
+        future.add_done_callback(self._outstanding.discard)
+        if not destination.in_ring:
+            destination.in_ring = True
+            self._ring.append(destination)
+        self._dispatch()
+        return future
+
+    def _dispatch(self) -> None:
+        # 每轮每个地址最多发出一条，已达并发上限的地址跳过，一整轮没有进展时停止
+        skipped = 0
+        while self._ring and self._active < self.max_concurrency and skipped < len(self._ring):
+            destination = self._ring.popleft()
+            if destination.inflight >= self.destination_concurrency:
+                self._ring.append(destination)
+                skipped += 1
+                continue
+            skipped = 0
+            content, future = destination.queue.popleft()
+            if destination.queue:
+                self._ring.append(destination)
+            else:
+                destination.in_ring = False
+            if future.done():
+                continue
+            destination.inflight += 1
+            self._active += 1
+            task = asyncio.ensure_future(self._post(destination, content, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
 
+    async def _post(self, destination: _Destination, content: bytes, future: asyncio.Future) -> None:
+        try:
             response = await self.client.post(
-                webhook_url,
-                json=message,
+                destination.url,
+                content=content,
                 headers={"Content-Type": "application/json"}
             )
+            if not future.done():
+                future.set_result(response)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+                # 请求已被取消时没有人等待结果，这里取出异常避免 "exception was never retrieved"
+                future.exception()
+        finally:
+            destination.inflight -= 1
+            self._active -= 1
+            self._dispatch()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        result = []
+        for url, destination in self.destinations.items():
+            result.append({
+                "destination": mask_webhook_url(url),
+                "queued": len(destination.queue),
+                "inflight": destination.inflight,
+            })
+        return result
+
+    async def drain(self, timeout: float) -> None:
+        """等待排队中和发送中的消息完成，超时后取消剩余的发送"""
+        if not self._outstanding:
+            return
+        logger.info(f"Draining {len(self._outstanding)} queued/in-flight Feishu send(s), timeout {timeout:.1f}s")
+        _, not_done = await asyncio.wait(set(self._outstanding), timeout=timeout)
+        if not not_done:
+            return
+        for destination in self.destinations.values():
+            destination.queue.clear()
+            destination.in_ring = False
+        self._ring.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        for future in not_done:
+            future.cancel()
+        logger.warning(f"Cancelled {len(not_done)} Feishu send(s) after shutdown grace period")
+
+
+class WebhookHandler:
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            timeout=30.0,
+            proxies=None,
+            limits=httpx.Limits(max_connections=FEISHU_MAX_CONCURRENCY)
+        )
+        self.scheduler = DeliveryScheduler(
+            self.client,
+            FEISHU_MAX_CONCURRENCY,
+            FEISHU_DESTINATION_CONCURRENCY,
+            FEISHU_DESTINATION_QUEUE_SIZE
+        )
+
+    async def drain(self, timeout: float) -> None:
+        await self.scheduler.drain(timeout)
+
+    async def send_to_feishu(self, issue_data: Dict[str, Any], webhook_url: str = None,
+                             message: Dict[str, Any] = None) -> bool:
+        """发送到指定URL或项目对应的全部URL，全部成功时返回 True"""
+        results = await self.fan_out(issue_data, [webhook_url] if webhook_url else None, message)
+        return bool(results) and all(result["success"] for result in results)
+
+    async def fan_out(self, issue_data: Dict[str, Any], webhook_urls: List[str] = None,
+                      message: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """卡片只构建和序列化一次，并发发送到所有目标，返回每个目标的发送结果"""
+        # 如果没有提供webhook_urls，则根据项目获取对应的URL
+        if webhook_urls is None:
+            webhook_urls = get_project_webhook_urls(issue_data)
+
+        valid_urls = []
+        for webhook_url in webhook_urls:
+            if webhook_url and webhook_url.startswith(('http://', 'https://')):
+                valid_urls.append(webhook_url)
+            else:
+                logger.error(f"Invalid webhook URL: '{webhook_url}'")
+        if not valid_urls:
+            return []
+
+        try:
+            if message is None:
+                with timing_span("build_message"):
+                    message = FeishuMessage.build_message(issue_data)
+            if DEBUG_MODE:
+                with timing_span("log_message"):
+                    logger.debug(f"Built message: {json.dumps(message, indent=2, ensure_ascii=False)}")
+        except Exception as e:
+            logger.error(f"Failed to build message: {str(e)}")
+            logger.error(f"Issue data keys: {list(issue_data.keys())}")
+            return []
+
+        content = FeishuMessage.encode(message)
+        with timing_span("feishu_post"):
+            results = await asyncio.gather(*(self._post_content(webhook_url, content) for webhook_url in valid_urls))
+
+        return [
+            {"destination": mask_webhook_url(webhook_url), "success": success}
+            for webhook_url, success in zip(valid_urls, results)
+        ]
+
+    async def _post_content(self, webhook_url: str, content: bytes) -> bool:
+        try:
+            # 记录使用的Webhook URL（隐藏令牌以保护隐私）
+            logger.info(f"Sending to Feishu webhook: {mask_webhook_url(webhook_url)}")
+
+            # 请求被取消（如 Sentry 超时断开）时发送继续进行，关闭服务时统一等待
+            response = await asyncio.shield(self.scheduler.submit(webhook_url, content))
 
             if response.status_code == 200:
                 result = response.json()
@@ -630,13 +1872,44 @@ async def startup_event():
     else:
         logger.info("Using default webhook URL for all projects")
 
+    if sentry_enricher.enabled:
+        logger.info(f"Enriching thin payloads from Sentry API: {SENTRY_API_URL}")
+
+    if WEBHOOK_ROUTES:
+        logger.info(f"Configured {len(WEBHOOK_ROUTES)} additional webhook route(s)")
+
+    if PROJECT_CARD_TEMPLATES:
+        logger.info(f"Configured card templates for projects: {list(PROJECT_CARD_TEMPLATES.keys())}")
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    # 生产模式下等待进行中的请求已用掉一部分宽限期，排空发送只使用剩余时间
+    deadline = getattr(app.state, "shutdown_deadline", None)
+    timeout = SHUTDOWN_GRACE_SECONDS if deadline is None else max(deadline - time.monotonic(), 0)
+    await webhook_handler.drain(timeout)
     await webhook_handler.client.aclose()
+    await sentry_enricher.close()
     logger.info("Sentry-Feishu webhook service stopped")
 
 
+@app.middleware("http")
+async def request_timing_middleware(request: Request, call_next):
+    """记录请求各阶段耗时，请求头带 X-Debug-Timing: 1 时通过 Server-Timing 响应头返回"""
+    timing = RequestTiming()
+    token = _current_timing.set(timing)
+    try:
+        with timing.span("total"):
+            response = await call_next(request)
+    finally:
+        _current_timing.reset(token)
+    if request.headers.get("x-debug-timing", "").lower() in ("1", "true"):
+        response.headers["Server-Timing"] = timing.server_timing()
+    if DEBUG_MODE and len(timing.spans) > 1:
+        logger.debug(f"Request timing {request.url.path}: {timing.server_timing()}")
+    return response
+
+
 @app.get("/")
 async def root():
     return {
@@ -651,75 +1924,175 @@ async def health():
     return {"status": "healthy"}
 
 
-@app.post("/webhook/sentry")
-async def receive_sentry_webhook(request: Request):
-    try:
-        body = await request.body()
-        if DEBUG_MODE:
-            logger.debug(f"receive_sentry_webhook body: {body}")
-        data = json.loads(body)
+def require_admin(request: Request) -> None:
+    """校验管理接口令牌，未配置 ADMIN_TOKEN 时管理接口不可用"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
 
-        logger.info(f"Received webhook with keys: {list(data.keys())}")
 
-        if DEBUG_MODE:
-            logger.debug(f"Webhook action: {data.get('action')}")
+@app.get("/stats/delivery")
+async def delivery_stats(request: Request):
+    # 暴露各项目的 Webhook 地址和积压情况，需要管理接口令牌
+    require_admin(request)
+    return {"destinations": webhook_handler.scheduler.stats()}
 
-        action = data.get("action", "unknown")
-        # 检查项目是否应该被忽略
-        if should_ignore_project(data):
-            project = FeishuMessage._extract_nested_value(data, 'project')
-            project_info = ""
-            if isinstance(project, dict):
-                project_info = f"ID: {project.get('id')}, Name: {project.get('name', project.get('slug', 'Unknown'))}"
-            else:
-                project_info = str(project)
-            
-            logger.info(f"Ignoring project in ignore list: {project_info}")
+
+@app.get("/stats/storm")
+async def storm_stats(request: Request):
+    # 包含项目名称和 issue 标题，需要管理接口令牌
+    require_admin(request)
+    return alert_storm_detector.stats()
+
+
+@app.post("/admin/profile")
+async def admin_profile(request: Request, seconds: float = 10.0):
+    """开启采样分析器 N 秒并返回聚合结果"""
+    require_admin(request)
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="Profiler is already running")
+
+    seconds = min(max(seconds, 0.1), 60.0)
+    logger.info(f"Starting sampling profiler for {seconds}s")
+    return await profiler.capture(seconds)
+
+
+async def process_sentry_payload(data: Dict[str, Any], adapter: PayloadAdapter) -> Dict[str, Any]:
+    """处理已解析的 Sentry 负载并返回响应结果，失败时抛出 HTTPException"""
+    action = data.get("action") or adapter.default_action
+    if DEBUG_MODE:
+        logger.debug(f"Webhook resource: {adapter.resource}, action: {action}")
+
+    if not adapter.accepts(action):
+        logger.info(f"Ignoring {adapter.resource} action: {action}")
+        return {"status": "ignored", "message": f"Action {action} ignored"}
+
+    with timing_span("extract"):
+        issue_data = adapter.extract(data)
+    if not isinstance(issue_data, dict):
+        logger.error(f"No issue data found for resource {adapter.resource}. Keys: {list(data.keys())}")
+        raise HTTPException(status_code=400, detail="Invalid webhook data format")
+
+    # 检查项目是否应该被忽略
+    with timing_span("ignore_check"):
+        ignored = should_ignore_project(issue_data)
+    if ignored:
+        project = FeishuMessage._extract_nested_value(issue_data, 'project')
+        project_info = ""
+        if isinstance(project, dict):
+            project_info = f"ID: {project.get('id')}, Name: {project.get('name', project.get('slug', 'Unknown'))}"
+        else:
+            project_info = str(project)
+        
+        logger.info(f"Ignoring project in ignore list: {project_info}")
+        return {
+            "status": "ignored", 
+            "message": f"Project {project_info} is in ignore list",
+            "action": action
+        }
+
+    # 告警风暴期间只发送摘要
+    with timing_span("storm_check"):
+        storm = alert_storm_detector.observe(issue_data)
+    if storm["storm"]:
+        if not storm["send_summary"]:
+            logger.info(f"Suppressing alert for project in storm: {storm['project']}")
             return {
-                "status": "ignored", 
-                "message": f"Project {project_info} is in ignore list",
+                "status": "suppressed",
+                "message": f"Project {storm['project']} is in alert storm, summary only",
                 "action": action
             }
+        message = FeishuMessage.build_storm_summary(
+            storm["project"],
+            storm["rate"],
+            alert_storm_detector.window_seconds,
+            alert_storm_detector.top_issues(storm["project"])
+        )
+        results = await webhook_handler.fan_out(issue_data, message=message)
+    else:
+        with timing_span("enrich"):
+            issue_data = await sentry_enricher.enrich(issue_data)
+        results = await webhook_handler.fan_out(issue_data)
+
+    sent = sum(1 for result in results if result["success"])
+    if results and sent == len(results):
+        return {
+            "status": "success",
+            "message": "Notification sent to Feishu",
+            "action": action,
+            "destinations": results
+        }
+    elif sent:
+        # 部分成功时不返回错误，避免 Sentry 重试导致已成功的群重复收到消息
+        logger.warning(f"Notification sent to {sent}/{len(results)} Feishu destinations")
+        return {
+            "status": "partial",
+            "message": f"Notification sent to {sent}/{len(results)} Feishu destinations",
+            "action": action,
+            "destinations": results
+        }
+    else:
+        raise HTTPException(status_code=500, detail="Failed to send to Feishu")
 
-        issue_data = None
-        if "data" in data:
-            # 处理 Sentry webhook 格式 - 数据可能在 data.error 中
-            if "error" in data["data"]:
-                issue_data = data["data"]["error"]  # 错误数据在 data.error 中
-                # logger.info("Found error data in data.error")
-            else:
-                issue_data = data["data"]  # 或者直接在 data 中
-                logger.info("Found data directly in data")
 
-            # logger.info(f"Processing {action} action for issue")
+async def read_sentry_payload(request: Request, adapter: Optional[PayloadAdapter]) -> Tuple[Dict[str, Any], PayloadAdapter]:
+    """读取并解析请求体，没有 Sentry-Hook-Resource 请求头时根据负载结构确定适配器"""
+    with timing_span("read_body"):
+        body = await request.body()
+    if DEBUG_MODE:
+        with timing_span("log_body"):
+            logger.debug(f"receive_sentry_webhook body: {body}")
+    with timing_span("parse_json"):
+        data = json.loads(body)
+    if not isinstance(data, dict):
+        logger.error(f"Invalid webhook data: expected a JSON object, got {type(data).__name__}")
+        raise HTTPException(status_code=400, detail="Invalid webhook data format")
 
-            if action != "created":
-                logger.info(f"Ignoring non-created action: {action}")
-                return {"status": "ignored", "message": f"Action {action} ignored"}
+    logger.info(f"Received webhook with keys: {list(data.keys())}")
 
-        elif "id" in data and ("message" in data or "title" in data):
-            issue_data = data
-            action = "direct"
-            logger.info("Processing direct issue data")
-        else:
+    if adapter is None:
+        adapter = detect_payload_adapter(data)
+        if adapter is None:
             logger.error(f"Invalid webhook data. Keys: {list(data.keys())}")
             raise HTTPException(status_code=400, detail="Invalid webhook data format")
+    return data, adapter
 
 
-        success = await webhook_handler.send_to_feishu(issue_data)
-
-        if success:
-            return {
-                "status": "success",
-                "message": "Notification sent to Feishu",
-                "action": action
-            }
-        else:
-            raise HTTPException(status_code=500, detail="Failed to send to Feishu")
+@app.post("/webhook/sentry")
+async def receive_sentry_webhook(request: Request):
+    try:
+        # 优先根据请求头分发，不需要的资源类型无需读取和解析请求体
+        resource = request.headers.get("sentry-hook-resource")
+        adapter = None
+        if resource:
+            adapter = PAYLOAD_ADAPTERS.get(resource)
+            if adapter is None or adapter.actions == ():
+                logger.info(f"Ignoring Sentry hook resource: {resource}")
+                return {"status": "ignored", "message": f"Resource {resource} ignored", "resource": resource}
+
+        data, adapter = await read_sentry_payload(request, adapter)
+
+        # Sentry 每次重试都会生成新的 Request-ID，优先按事件去重，没有 event_id 时才使用 Request-ID
+        key = adapter.delivery_key(data)
+        if key is None and request.headers.get("request-id"):
+            key = f"request:{request.headers['request-id']}"
+        if key is None:
+            return await process_sentry_payload(data, adapter)
+
+        future = idempotency_cache.get(key)
+        if future is not None:
+            logger.info(f"Duplicate Sentry delivery {key}, returning original result")
+            return await asyncio.shield(future)
+        # 查询和登记之间不能有 await，否则并发的重复投递都会未命中
+        future = idempotency_cache.start(key)
+        return await idempotency_cache.run(key, future, process_sentry_payload(data, adapter))
 
     except json.JSONDecodeError:
         logger.error("Invalid JSON in request body")
         raise HTTPException(status_code=400, detail="Invalid JSON")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Webhook processing error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -744,7 +2117,62 @@ async def test_feishu_notification():
     else:
         raise HTTPException(status_code=500, detail="Failed to send test notification")
 
+def default_workers() -> int:
+    """按可用 CPU 数量计算 worker 数，容器中优先使用 cgroup 的 CPU 配额"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, max(int(int(quota) / int(period)), 1))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
+
+
+class GracefulServer(uvicorn.Server):
+    """开始关闭时记录截止时间，等待进行中的请求和排空飞书发送共用同一个宽限期"""
+
+    async def shutdown(self, sockets=None) -> None:
+        # worker 进程中应用所在的模块是 main 而不是 __main__，按导入路径取得实际运行的应用
+        served_app = import_from_string(self.config.app)
+        served_app.state.shutdown_deadline = time.monotonic() + self.config.timeout_graceful_shutdown
+        await super().shutdown(sockets=sockets)
+
+
+def run_production(port: int) -> None:
+    """生产模式启动: 可用时使用 uvloop/httptools，按 CPU 数量启动 worker，收到 SIGTERM 后停止接收新请求并在宽限期内排空"""
+    import importlib.util
+    from uvicorn.supervisors import Multiprocess
+
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    workers = int(os.getenv("WORKERS", "0")) or default_workers()
+    # worker 进程重新导入本模块，通过环境变量让其同样进入生产模式
+    os.environ["LAUNCH_MODE"] = "production"
+    logger.info(f"Starting production server: workers={workers}, loop={loop}, http={http}")
+    config = uvicorn.Config(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_graceful_shutdown=SHUTDOWN_GRACE_SECONDS,
+    )
+    server = GracefulServer(config)
+    if config.workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
 if __name__ == "__main__":
-    import uvicorn
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    if PRODUCTION_MODE:
+        run_production(port)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+测试脚本：本地 Sentry API 桩服务，验证负载补充
+
+用法：
+    python test_sentry_stub.py serve          # 在 9001 端口启动桩服务
+    SENTRY_API_URL=http://127.0.0.1:9001 SENTRY_API_TOKEN=test python main.py
+    python test_sentry_stub.py                # 发送缺少堆栈的告警
+
+issue ID 决定桩服务的响应：18 返回正常事件，19 返回列表，20 返回结构错误的事件，21 返回 500。
+后三种情况卡片应按原数据发送，不应返回 500。
+"""
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpx
+
+STUB_PORT = 9001
+
+# 精简自 /api/0/issues/{issue_id}/events/latest/ 的实际响应
+latest_event = {
+    "eventID": "612e5ffe74b9421f8e0f74da884ed301",
+    "tags": [
+        {"key": "environment", "value": "production"},
+        {"key": "release", "value": "midooserver@1.2.3"}
+    ],
+    "entries": [
+        {
+            "type": "exception",
+            "data": {
+                "values": [
+                    {
+                        "type": "ValueError",
+                        "value": "invalid literal for int() with base 10: 'abc'",
+                        "stacktrace": {
+                            "frames": [
+                                {"filename": "site-packages/django/core/handlers/base.py", "function": "_get_response", "lineno": 197, "in_app": False},
+                                {"filename": "app/views.py", "abs_path": "/srv/app/views.py", "function": "poll", "lineno": 42, "in_app": True},
+                                {"filename": "app/utils.py", "abs_path": "/srv/app/utils.py", "function": "parse_id", "lineno": 7, "in_app": True}
+                            ]
+                        }
+                    }
+                ]
+            }
+        }
+    ]
+}
+
+stub_responses = {
+    "18": (200, latest_event),
+    "19": (200, [latest_event]),
+    "20": (200, {"entries": [{"type": "exception", "data": {"values": {"stacktrace": None}}}]}),
+    "21": (500, {"detail": "Internal Error"}),
+}
+
+
+class SentryStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        # api/0/issues/{issue_id}/events/latest
+        issue_id = parts[3] if len(parts) >= 4 else ""
+        status, body = stub_responses.get(issue_id, (404, {"detail": "Not found"}))
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def serve():
+    print(f"🚀 Sentry API 桩服务已启动: http://127.0.0.1:{STUB_PORT}")
+    HTTPServer(("127.0.0.1", STUB_PORT), SentryStubHandler).serve_forever()
+
+
+def build_webhook_data(issue_id):
+    # 旧版 Webhooks 插件格式，不包含堆栈
+    return {
+        "id": issue_id,
+        "project": "midooserver-dev",
+        "project_name": "midooserver-dev",
+        "level": "error",
+        "culprit": "app/views.py in poll",
+        "message": "ValueError: invalid literal for int() with base 10: 'abc'",
+        "url": f"http://127.0.0.1:9000/organizations/sentry/issues/{issue_id}/?referrer=webhooks_plugin",
+        "triggering_rules": [""],
+        "event": {
+            "event_id": f"stub-event-{issue_id}",
+            "level": "error"
+        }
+    }
+
+
+def test_webhook():
+    for issue_id in stub_responses:
+        try:
+            response = httpx.post(
+                "http://localhost:8000/webhook/sentry",
+                json=build_webhook_data(issue_id),
+                headers={"Content-Type": "application/json"},
+                timeout=30.0
+            )
+            print(f"issue {issue_id} 状态码: {response.status_code}")
+            print(f"响应: {json.dumps(response.json(), indent=2, ensure_ascii=False)}")
+
+            if response.status_code == 200:
+                print("✅ 测试成功！")
+            else:
+                print(f"❌ 测试失败: {response.text}")
+
+        except httpx.ConnectError:
+            print("❌ 无法连接到服务，请确保服务正在运行")
+            print("运行命令: SENTRY_API_URL=http://127.0.0.1:9001 SENTRY_API_TOKEN=test python main.py")
+            return
+        except Exception as e:
+            print(f"❌ 错误: {str(e)}")
+
+    print("\n请检查飞书群：issue 18 的卡片应包含 app/utils.py 等堆栈帧，其余按原数据显示 culprit。")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        serve()
+    else:
+        print("🚀 测试 Sentry API 负载补充...\n")
+        test_webhook()